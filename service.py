@@ -1,18 +1,40 @@
 import os
-import yaml
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
 import subprocess
-import tempfile
 import shutil
-import stat
+from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple, Union
 
-from reviewer.reviewer import run_rule_checks, run_ai_review
+from reviewer.config import load_config
+from reviewer.reviewer import (
+    fetch_pr,
+    run_rule_checks,
+    run_ai_review_async,
+    stream_ai_review,
+    parse_review_text,
+)
 
-# Load config
-cfg = yaml.safe_load(open("config.yaml", encoding="utf-8"))
+# Load + validate config once at startup
+cfg = load_config()
+
+# Bounded pool for the blocking git / linter work, so it never runs on the event loop
+EXECUTOR = ThreadPoolExecutor(max_workers=cfg.workers)
+
+# Warm bare clones, one per repo_url, reused across requests
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai-reviewer")
+BARE_CACHE: Dict[str, str] = {}
+REPO_LOCKS: Dict[str, asyncio.Lock] = {}
+
+# never block on a credential prompt, fail the request instead
+GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
 
 app = FastAPI(title="AI Code Reviewer Service")
 
@@ -30,66 +52,170 @@ class ReviewResponse(BaseModel):
     security:         List[str]
     ai_comments:      List[str]
     ai_score:         float
+    # every configured rule by name, custom ones (e.g. regex rules) included
+    rules:            Dict[str, List[str]] = {}
 
 
-@app.post("/review", response_model=ReviewResponse)
-def review(req: ReviewRequest):
-    try:
-        # 1) Compute unified diff text
-        if req.repo_url and req.pr_number:
-            tmp_dir = tempfile.mkdtemp(prefix="ai-review-")
+class BatchReviewRequest(BaseModel):
+    items: List[ReviewRequest]
+
+
+class BatchItemError(BaseModel):
+    error: str
+
+
+def _bare_repo(repo_url: str) -> str:
+    """
+    Return the cached bare, blob-less clone for repo_url, creating it on first use.
+    """
+    path = BARE_CACHE.get(repo_url)
+    if path is None:
+        path = os.path.join(
+            CACHE_DIR, hashlib.sha1(repo_url.encode("utf-8")).hexdigest() + ".git"
+        )
+        if not os.path.isdir(path):
+            os.makedirs(CACHE_DIR, exist_ok=True)
             try:
-                # a) shallow clone
-                subprocess.run(
-                    ["git", "clone", "--depth", "1", req.repo_url, tmp_dir],
-                    check=True
-                )
-                # b) fetch & checkout PR branch
-                subprocess.run(
-                    ["git", "fetch", "origin", f"pull/{req.pr_number}/head:pr_branch"],
-                    cwd=tmp_dir, check=True
-                )
                 subprocess.run(
-                    ["git", "checkout", "pr_branch"],
-                    cwd=tmp_dir, check=True
+                    ["git", "clone", "--bare", "--filter=blob:none", "--depth=1",
+                     repo_url, path],
+                    env=GIT_ENV, check=True
                 )
-                # c) get diff vs base
-                diff_bytes = subprocess.check_output(
-                    ["git", "diff", f"origin/{req.base}...HEAD"],
-                    cwd=tmp_dir
-                )
-                diff_text = diff_bytes.decode("utf-8", errors="ignore")
-            finally:
-                def on_rm_error(func, path, exc_info):
-                    os.chmod(path, stat.S_IWRITE)
-                    func(path)
-                shutil.rmtree(tmp_dir, onerror=on_rm_error)
-
-        else:
-            diff_text = req.diff or ""
-
-        # 2) Rule‐based checks
-        rules = run_rule_checks(
+            except subprocess.CalledProcessError:
+                # don't leave a half-written clone behind for the next request
+                shutil.rmtree(path, ignore_errors=True)
+                raise
+        BARE_CACHE[repo_url] = path
+    return path
+
+
+def _fetch_and_diff(repo_url: str, pr_number: int, base: str) -> Tuple[str, str]:
+    git_dir = _bare_repo(repo_url)
+    # a) refresh the PR and base tips in the warm repo, with enough history for a merge-base
+    rev_range = fetch_pr(git_dir, pr_number, base, env=GIT_ENV)
+    # b) diff the refs directly; blobs are fetched lazily, no working tree
+    diff_bytes = subprocess.check_output(
+        ["git", "-C", git_dir, "diff", rev_range],
+        env=GIT_ENV
+    )
+    return diff_bytes.decode("utf-8", errors="ignore"), rev_range
+
+
+async def _diff_for(req: ReviewRequest) -> Tuple[str, Optional[str]]:
+    """The diff text, plus the commit range it came from when the PR was fetched."""
+    if req.repo_url and req.pr_number:
+        # one fetch at a time per cached repo
+        async with REPO_LOCKS.setdefault(req.repo_url, asyncio.Lock()):
+            return await asyncio.get_running_loop().run_in_executor(
+                EXECUTOR, _fetch_and_diff, req.repo_url, req.pr_number, req.base
+            )
+    return req.diff or "", None
+
+
+def _start_rule_checks(req: ReviewRequest, diff_text: str, rev_range: Optional[str]) -> asyncio.Future:
+    return asyncio.get_running_loop().run_in_executor(
+        EXECUTOR,
+        functools.partial(
+            run_rule_checks,
             diff_text,
-            cfg["rules"],
+            cfg.rules,
             repo_url=req.repo_url,
             pr_number=req.pr_number,
-            base=req.base
+            base=req.base,
+            # lint straight out of the warm repo the diff came from, no second clone
+            git_dir=BARE_CACHE.get(req.repo_url) if rev_range else None,
+            rev_range=rev_range
         )
+    )
 
-        # 3) AI‐based review
-        ai_comments, ai_score = run_ai_review(diff_text, cfg["ai_review"])
 
-        # 4) Return a flat JSON
-        return ReviewResponse(
-            naming_convention = rules.get("naming_convention", []),
-            complexity        = rules.get("complexity", []),
-            security          = rules.get("security", []),
-            ai_comments       = ai_comments,
-            ai_score          = ai_score
-        )
+def _response(rules: dict, ai_comments: List[str], ai_score: float) -> ReviewResponse:
+    # Every field comes from our own linters / parser, so no constructor validation;
+    # response_model then serializes it in pydantic-core (not jsonable_encoder)
+    return ReviewResponse.model_construct(
+        naming_convention = rules.get("naming_convention", []),
+        complexity        = rules.get("complexity", []),
+        security          = rules.get("security", []),
+        ai_comments       = ai_comments,
+        ai_score          = ai_score,
+        rules             = rules
+    )
+
+
+async def _review_one(req: ReviewRequest, ai_slot=contextlib.nullcontext()) -> ReviewResponse:
+    # 1) Compute unified diff text
+    diff_text, rev_range = await _diff_for(req)
+
+    # 2) Rule‐based checks (worker pool) and AI‐based review (async HTTP),
+    #    run concurrently so the LLM latency overlaps the linter time
+    rules_task = _start_rule_checks(req, diff_text, rev_range)
+
+    async def ai_task():
+        async with ai_slot:
+            return await run_ai_review_async(diff_text, cfg.ai_review)
+
+    rules, (ai_comments, ai_score) = await asyncio.gather(rules_task, ai_task())
+
+    # 3) Return a flat JSON
+    return _response(rules, ai_comments, ai_score)
+
+
+def _error_detail(e: Exception) -> str:
+    if isinstance(e, subprocess.CalledProcessError):
+        return f"Git error: {e}"
+    return str(e)
+
+
+@app.post("/review", response_model=ReviewResponse)
+async def review(req: ReviewRequest):
+    try:
+        return await _review_one(req)
 
-    except subprocess.CalledProcessError as cpe:
-        raise HTTPException(500, detail=f"Git error: {cpe}")
     except Exception as e:
-        raise HTTPException(500, detail=str(e))
+        raise HTTPException(500, detail=_error_detail(e))
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@app.post("/review/stream")
+async def review_stream(req: ReviewRequest):
+    """
+    Server-Sent Events: one `token` event per chunk of AI text as it is
+    generated, then a final `result` event with the full ReviewResponse.
+    """
+    async def events():
+        try:
+            diff_text, rev_range = await _diff_for(req)
+            rules_task = _start_rule_checks(req, diff_text, rev_range)
+
+            buffer = []
+            async for delta in stream_ai_review(diff_text, cfg.ai_review):
+                buffer.append(delta)
+                yield _sse("token", json.dumps(delta))
+
+            ai_comments, ai_score = parse_review_text("".join(buffer))
+            rules = await rules_task
+            yield _sse("result", _response(rules, ai_comments, ai_score).model_dump_json())
+
+        # the 200 header is already sent, so errors go out as a final event
+        except Exception as e:
+            yield _sse("error", json.dumps(_error_detail(e)))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/review_batch", response_model=List[Union[ReviewResponse, BatchItemError]])
+async def review_batch(batch: BatchReviewRequest):
+    # Pipeline all PRs at once, but cap in-flight OpenAI calls to respect rate limits
+    ai_slots = asyncio.Semaphore(cfg.ai_review.batch_concurrency)
+    results = await asyncio.gather(
+        *(_review_one(item, ai_slots) for item in batch.items),
+        return_exceptions=True
+    )
+    # a failed item gets its error in place, the finished reviews (and their OpenAI spend) are kept
+    return [
+        BatchItemError(error=_error_detail(r)) if isinstance(r, Exception) else r
+        for r in results
+    ]
@@ -1,15 +1,99 @@
+import io
 import os
-import sys
 import subprocess
+import sys
 import tempfile
-import shutil
-import stat
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import click
-import yaml
+import pygit2
+from pygit2.enums import CredentialType, DiffFind
 
+from reviewer.config import load_config
 from reviewer.reviewer import run_rule_checks, run_ai_review, post_pr_comment
 
+# History fetched per attempt in PR mode; libgit2 reads 2**31 - 1 as "unshallow"
+_FETCH_DEPTHS = (1, 50, 500, 2**31 - 1)
+
+
+def _github_host() -> str:
+    # Actions sets GITHUB_SERVER_URL, which is the GitHub Enterprise host there
+    return urlparse(os.getenv("GITHUB_SERVER_URL") or "https://github.com").hostname
+
+
+class _GitCredentials(pygit2.RemoteCallbacks):
+    """
+    Auth for the PR fetch. libgit2 doesn't run git's credential machinery, so try
+    GITHUB_TOKEN (CI; only ever sent to the GitHub host), then the user's git
+    credential helpers (which scope credentials by host themselves), then the
+    ssh-agent; each at most once, so rejected credentials fail the fetch instead
+    of looping.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._tried = set()
+
+    def _first_try(self, method: str) -> bool:
+        fresh = method not in self._tried
+        self._tried.add(method)
+        return fresh
+
+    def credentials(self, url, username_from_url, allowed_types):
+        if allowed_types & CredentialType.USERPASS_PLAINTEXT:
+            token = os.getenv("GITHUB_TOKEN")
+            if token and urlparse(url).hostname == _github_host() and self._first_try("token"):
+                return pygit2.UserPass("x-access-token", token)
+            if self._first_try("helper"):
+                found = subprocess.run(
+                    ["git", "credential", "fill"],
+                    input=f"url={url}\n\n",
+                    capture_output=True,
+                    text=True,
+                    env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+                )
+                fields = dict(l.split("=", 1) for l in found.stdout.splitlines() if "=" in l)
+                if found.returncode == 0 and "password" in fields:
+                    return pygit2.UserPass(fields.get("username", ""), fields["password"])
+        if allowed_types & CredentialType.SSH_KEY and self._first_try("agent"):
+            return pygit2.KeypairFromAgent(username_from_url or "git")
+        return super().credentials(url, username_from_url, allowed_types)
+
+
+def _fetch_pr(git_dir, repo_url, pr_number, base):
+    """
+    Shallow-fetch the PR and base tips into a new bare repo at git_dir and diff them
+    in-process (libgit2). Returns the diff and the commit range it covers, which the
+    rule checks then lint straight out of the same repo.
+    """
+    repo = pygit2.init_repository(git_dir, bare=True)
+    origin = repo.remotes.create("origin", repo_url)
+    # only the PR tip and the base tip, deepened until they share a merge-base
+    pr_ref, base_ref = f"refs/pr/{pr_number}", f"refs/base/{base}"
+    callbacks = _GitCredentials()
+    for depth in _FETCH_DEPTHS:
+        origin.fetch(
+            [f"+refs/pull/{pr_number}/head:{pr_ref}", f"+refs/heads/{base}:{base_ref}"],
+            callbacks=callbacks,
+            depth=depth,
+        )
+        pr_id = repo.references[pr_ref].target
+        merge_base = repo.merge_base(repo.references[base_ref].target, pr_id)
+        if merge_base is not None or not repo.is_shallow:
+            break
+    # diff from the merge-base, like `git diff base...pr` (no checkout needed);
+    # unrelated histories fall back to the base tip
+    from_id = merge_base or repo.references[base_ref].target
+    patch = repo.diff(repo[from_id], repo[pr_id])
+    # git diff detects renames by default, libgit2 only when asked
+    patch.find_similar(flags=DiffFind.FIND_RENAMES)
+    diff = patch.patch or ""
+    # release libgit2's file handles so the cleanup works on Windows
+    repo.free()
+    return diff, f"{from_id}..{pr_id}"
+
+
 @click.command()
 @click.option("--repo-url", help="HTTPS URL of the GitHub repo")
 @click.option("--pr-number", type=int, help="Pull request number")
@@ -19,69 +103,55 @@ from reviewer.reviewer import run_rule_checks, run_ai_review, post_pr_comment
 @click.option("-o", "--output-file", type=click.Path(), help="Write report to this file")
 def main(repo_url, pr_number, base, diff_file, auto_reject, output_file):
     """AI Code Reviewer CLI."""
-    cfg = yaml.safe_load(open("config.yaml", encoding="utf-8"))
-
-    # 1) Determine the unified diff text
-    if repo_url and pr_number:
-        # PR-mode: shallow clone & checkout, then git-diff
-        tmp_dir = tempfile.mkdtemp(prefix="ai-review-")
-        try:
-            # a) clone
-            subprocess.run(
-                ["git", "clone", "--depth", "1", repo_url, tmp_dir],
-                check=True
-            )
-            # b) fetch + checkout PR branch
-            subprocess.run(
-                ["git", "fetch", "origin", f"pull/{pr_number}/head:pr_branch"],
-                cwd=tmp_dir, check=True
-            )
-            subprocess.run(
-                ["git", "checkout", "pr_branch"],
-                cwd=tmp_dir, check=True
-            )
-            # c) get unified diff vs base branch
-            diff_bytes = subprocess.check_output(
-                ["git", "diff", f"origin/{base}...HEAD"],
-                cwd=tmp_dir
-            )
-            diff = diff_bytes.decode("utf-8", errors="ignore")
-        finally:
-            # cleanup (handle read-only on Windows)
-            def on_rm_error(func, path, _):
-                os.chmod(path, stat.S_IWRITE)
-                func(path)
-            shutil.rmtree(tmp_dir, onerror=on_rm_error)
-
-    elif diff_file:
-        # Diff-file mode
-        diff = open(diff_file, encoding="utf-8").read()
-
-    else:
-        click.echo("❌ Provide either a DIFF_FILE or both --repo-url and --pr-number", err=True)
-        sys.exit(1)
-
-    # 2) Rule-based checks
-    rules = run_rule_checks(diff, cfg["rules"], repo_url, pr_number, base)
+    cfg = load_config()
+
+    # PR mode fetches into tmp_dir; it lives until the rule checks have linted out of it
+    # (TemporaryDirectory also clears read-only files on Windows)
+    with tempfile.TemporaryDirectory(prefix="ai-review-") as tmp_dir:
+        # 1) Determine the unified diff text
+        git_dir = rev_range = None
+        if repo_url and pr_number:
+            # PR-mode: shallow-fetch the PR and base tips, then diff them in-process (libgit2)
+            git_dir = tmp_dir
+            diff, rev_range = _fetch_pr(git_dir, repo_url, pr_number, base)
+
+        elif diff_file:
+            # Diff-file mode
+            diff = open(diff_file, encoding="utf-8").read()
+
+        else:
+            click.echo("❌ Provide either a DIFF_FILE or both --repo-url and --pr-number", err=True)
+            sys.exit(1)
 
-    # 3) AI-based review (same diff)
-    ai_comments, ai_score = run_ai_review(diff, cfg["ai_review"])
+        # 2) Rule-based checks and 3) AI-based review of the same diff, run side by side
+        #    so the OpenAI latency overlaps the linter time
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            rules_future = pool.submit(
+                run_rule_checks, diff, cfg.rules, repo_url, pr_number, base, git_dir, rev_range
+            )
+            ai_future = pool.submit(run_ai_review, diff, cfg.ai_review)
+            rules = rules_future.result()
+            ai_comments, ai_score = ai_future.result()
 
     # 4) Build the markdown report
     total = sum(len(v) for v in rules.values()) + len(ai_comments)
-    lines = ["# AI Code Quality Report", ""]
-    lines.append("## Rule-based Violations")
+    # (written straight into one buffer; each line carries its leading newline)
+    buf = io.StringIO()
+    w = buf.write
+    w("# AI Code Quality Report\n\n## Rule-based Violations")
     for name, items in rules.items():
-        lines.append(f"### {name} ({len(items)})")
-        lines += [f"- {i}" for i in items]
-
-    lines.append("\n## AI Suggestions")
-    if ai_score >= cfg["ai_review"]["min_confidence"]:
-        lines += [f"- {c}" for c in ai_comments[: cfg["ai_review"]["max_comments"]]]
+        w(f"\n### {name} ({len(items)})")
+        for i in items:
+            w(f"\n- {i}")
+
+    w("\n\n## AI Suggestions")
+    if ai_score >= cfg.ai_review.min_confidence:
+        for c in ai_comments[: cfg.ai_review.max_comments]:
+            w(f"\n- {c}")
     else:
-        lines.append(f"*Skipped AI feedback (confidence {ai_score:.2f} < threshold).*")
+        w(f"\n*Skipped AI feedback (confidence {ai_score:.2f} < threshold).*")
 
-    report = "\n".join(lines)
+    report = buf.getvalue()
     click.echo(report)
 
     # 5) Optional file write
@@ -95,8 +165,8 @@ def main(repo_url, pr_number, base, diff_file, auto_reject, output_file):
         post_pr_comment(report)
 
     # 7) Auto-reject
-    if auto_reject or cfg["auto_reject"]["enabled"]:
-        if total > cfg["auto_reject"]["overall_threshold"]:
+    if auto_reject or cfg.auto_reject.enabled:
+        if total > cfg.auto_reject.overall_threshold:
             click.echo(f"{total} violations > threshold", err=True)
             sys.exit(1)
 
@@ -0,0 +1,60 @@
+import re
+import yaml
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Literal, Optional
+
+# libyaml's C loader when available; the pure-Python one is several times slower
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class RuleConfig(BaseModel):
+    tool: Literal["flake8", "radon", "bandit", "regex"]
+    threshold: int = Field(0, ge=0)  # 0 = no limit
+    pattern: Optional[str] = None  # only for tool: regex
+
+    @model_validator(mode="after")
+    def _check_pattern(self):
+        if self.tool == "regex":
+            if not self.pattern:
+                raise ValueError("regex rules need a 'pattern'")
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                # re.error isn't a ValueError, so pydantic wouldn't report it as a validation error
+                raise ValueError(f"invalid regex pattern {self.pattern!r}: {e}") from e
+        return self
+
+
+class AiReviewConfig(BaseModel):
+    model: str = "gpt-4o-mini"
+    temperature: float = Field(0.2, ge=0, le=2)
+    max_comments: int = Field(10, ge=0)
+    min_confidence: float = Field(0.7, ge=0, le=1)
+    batch_concurrency: int = Field(8, ge=1)
+    max_hunk_lines: int = Field(200, ge=1)
+    rpm: Optional[int] = Field(None, ge=1)  # OpenAI requests per minute; None = unlimited
+    # Generated / vendored files that only burn prompt tokens
+    skip_globs: List[str] = ["*.lock", "package-lock.json", "*.svg", "*.min.js"]
+
+
+class AutoRejectConfig(BaseModel):
+    enabled: bool = False
+    overall_threshold: int = Field(0, ge=0)
+
+
+class Config(BaseModel):
+    workers: int = Field(4, ge=1)
+    rules: Dict[str, RuleConfig]
+    ai_review: AiReviewConfig = AiReviewConfig()
+    auto_reject: AutoRejectConfig = AutoRejectConfig()
+
+
+def load_config(path: str = "config.yaml") -> Config:
+    """Parse and validate config.yaml once; config errors surface here, not mid-request."""
+    with open(path, encoding="utf-8") as f:
+        return Config.model_validate(yaml.load(f, Loader=_Loader))
+
+
+def as_rules(rules_cfg) -> Dict[str, RuleConfig]:
+    # accepts the validated models or plain dicts (e.g. straight from YAML)
+    return {name: RuleConfig.model_validate(c) for name, c in rules_cfg.items()}
@@ -1,120 +1,606 @@
 import os
+import asyncio
+import configparser
+import json
+import multiprocessing
+import re
+import shelve
 import subprocess
 import tempfile
 import shutil
-import json
 import stat
+import threading
+import tokenize
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import bandit
 import openai
+import pycodestyle
 import requests
+from bandit.core.config import BanditConfig
+from bandit.core.constants import EXCLUDE as BANDIT_EXCLUDE
+from bandit.core import utils as bandit_utils
+from bandit.core.manager import BanditManager
+from blake3 import blake3
 from dotenv import load_dotenv
+from flake8.api import legacy as flake8_legacy
+from flake8.main import application as flake8_app
+from flake8.options.parse_args import parse_args as flake8_parse_args
+from flake8.formatting.base import BaseFormatter
+from radon.complexity import cc_rank, cc_visit, sorted_results
+from requests.adapters import HTTPAdapter
+from unidiff import PatchSet, UnidiffParseError
+from urllib3.util.retry import Retry
+from bisect import bisect_right
+from fnmatch import fnmatch
 from typing import Dict, List, Optional
 
+from .config import AiReviewConfig, RuleConfig, as_rules
+
+try:
+    import hyperscan
+except ImportError:  # optional accelerator, FastRules falls back to `re`
+    hyperscan = None
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
+class _LRUCache:
+    """Small thread-safe LRU used to memoize rule/AI results per diff."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_rule_cache = _LRUCache(maxsize=512)
+_ai_cache = _LRUCache(maxsize=512)
+
+
+def _dump_model(obj):
+    # lets json.dumps serialize the config models inside cache keys
+    return obj.model_dump()
+
+
+def _cache_key(diff: str, *params) -> str:
+    """Hash the (possibly large) diff, then append the settings that affect the result."""
+    # BLAKE3 is SIMD-accelerated and hashes big inputs on several threads
+    digest = blake3(diff.encode("utf-8"), max_threads=blake3.AUTO).hexdigest(16)
+    return digest + json.dumps(params, sort_keys=True, default=_dump_model)
+
+
 def run_rule_checks(
     diff: str,
-    rules_cfg: dict,
+    rules_cfg: Dict[str, RuleConfig],
     repo_url: Optional[str] = None,
     pr_number: Optional[int] = None,
     base: str = "main",
+    git_dir: Optional[str] = None,
+    rev_range: Optional[str] = None,
 ) -> dict:
     """
-    If repo_url+pr_number are provided, clone the PR and run full-file flake8, radon, bandit.
-    Otherwise, run flake8 --diff against the raw diff and skip the others.
+    If repo_url+pr_number are provided, run full-file flake8, radon, bandit on the PR's
+    changed files: checked out of git_dir when the caller already fetched the PR there
+    (rev_range being what fetch_pr returned), else out of a fresh shallow clone.
+    Otherwise, run flake8's style checks (pycodestyle) on the diff's hunks and skip the others.
+    Regex rules (see FastRules) are matched against the diff in both modes.
     """
-    if repo_url and pr_number:
-        return _clone_and_lint(repo_url, pr_number, base, rules_cfg)
-    else:
-        return _diff_only_lint(diff, rules_cfg)
+    rules_cfg = as_rules(rules_cfg)
+    key = _cache_key(diff, rules_cfg, repo_url, pr_number, base)
+    results = _rule_cache.get(key)
+    if results is None:
+        if repo_url and pr_number and git_dir and rev_range:
+            results = _lint_pr(git_dir, rev_range, rules_cfg)
+        elif repo_url and pr_number:
+            results = _clone_and_lint(repo_url, pr_number, base, rules_cfg)
+        else:
+            results = _diff_only_lint(diff, rules_cfg)
+        # regex rules only need the diff text, so they run the same in both modes
+        for name, issues in _fast_rules(rules_cfg).scan(diff).items():
+            thresh = rules_cfg[name].threshold
+            results[name] = issues[:thresh] if thresh else issues
+        _rule_cache.put(key, results)
+    return {name: list(issues) for name, issues in results.items()}
+
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def _added_lines(diff: str) -> List[tuple]:
+    """
+    (path, new-file line number, text) for every line the diff adds.
+    """
+    added = []
+    path, lineno = None, 0
+    # lines still due in the current hunk, so added text like "++ x" isn't read as a header
+    old_left = new_left = 0
+    for line in diff.splitlines():
+        if old_left > 0 or new_left > 0:
+            if line.startswith("+"):
+                added.append((path, lineno, line[1:]))
+                lineno += 1
+                new_left -= 1
+            elif line.startswith("-"):
+                old_left -= 1
+            elif not line.startswith("\\"):  # "\ No newline at end of file"
+                lineno += 1
+                old_left -= 1
+                new_left -= 1
+        elif line.startswith("+++ "):
+            path = line[4:].split("\t", 1)[0]
+            path = path[2:] if path.startswith("b/") else path
+        elif line.startswith("@@"):
+            m = _HUNK_RE.match(line)
+            if m:
+                old_left = int(m.group(1) or 1)
+                lineno = int(m.group(2))
+                new_left = int(m.group(3) or 1)
+    return added
+
+
+class FastRules:
+    """
+    All `tool: regex` rules, matched against the lines a diff adds.
+
+    With hyperscan installed, every pattern it can compile shares one database and
+    the added lines are scanned once; as that scan can match across lines, each hit
+    is then confirmed on its line with `re`, so both engines report the same hits.
+    Patterns hyperscan rejects (lookarounds, backreferences, ...), and all of them
+    without hyperscan, go through `re` alone, each compiled on its own exactly as
+    RuleConfig validated it.
+    """
+
+    def __init__(self, rules_cfg: Dict[str, RuleConfig]):
+        rules_cfg = as_rules(rules_cfg)
+        self.names = [name for name, cfg in rules_cfg.items() if cfg.tool == "regex"]
+        self.regexes = [re.compile(rules_cfg[name].pattern) for name in self.names]
+        hs_rules = []
+        self.db = None
+        if hyperscan is not None:
+            hs_rules = [i for i, rx in enumerate(self.regexes) if _hyperscan_compiles(rx.pattern)]
+        if hs_rules:
+            self.db = hyperscan.Database()
+            self.db.compile(
+                expressions=[self.regexes[i].pattern.encode("utf-8") for i in hs_rules],
+                ids=hs_rules,
+                flags=[_HS_FLAGS] * len(hs_rules),
+            )
+        self.re_rules = [i for i in range(len(self.names)) if i not in hs_rules]
+
+    def scan(self, diff: str) -> Dict[str, List[str]]:
+        results = {name: [] for name in self.names}
+        if not self.names:
+            return results
 
+        added = _added_lines(diff)
+        hits = set()
+        if self.db is not None:
+            hits |= self._scan_hyperscan(added)
+        if self.re_rules:
+            hits |= self._scan_re(added)
+        for rule, idx in sorted(hits, key=lambda h: (h[1], h[0])):
+            path, lineno, text = added[idx]
+            results[self.names[rule]].append(f"{path}:{lineno}: {text.strip()}")
+        return results
+
+    def _scan_hyperscan(self, added) -> set:
+        starts, offset = [], 0
+        for _, _, text in added:
+            starts.append(offset)
+            offset += len(text.encode("utf-8")) + 1
+        hits = set()
+
+        def on_match(rule, _start, end, _flags, _ctx):
+            hits.add((rule, bisect_right(starts, end - 1) - 1))
+
+        self.db.scan("\n".join(text for _, _, text in added).encode("utf-8"),
+                     match_event_handler=on_match)
+        # a match may span the joined lines (e.g. `\s` eating the "\n"); keep the in-line ones
+        return {(rule, idx) for rule, idx in hits if self.regexes[rule].search(added[idx][2])}
+
+    def _scan_re(self, added) -> set:
+        return {
+            (rule, idx)
+            for idx, (_, _, text) in enumerate(added)
+            for rule in self.re_rules
+            if self.regexes[rule].search(text)
+        }
+
+
+# UCP: Unicode \w / \b / \d, like `re` on str
+_HS_FLAGS = (hyperscan.HS_FLAG_MULTILINE | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP) if hyperscan else 0
+
+
+def _hyperscan_compiles(pattern: str) -> bool:
+    try:
+        hyperscan.Database().compile(expressions=[pattern.encode("utf-8")], ids=[0], flags=[_HS_FLAGS])
+    except hyperscan.error:
+        return False
+    return True
 
-def _diff_only_lint(diff: str, rules_cfg: dict) -> dict:
-    # Write diff to temp file
-    with open("temp.diff", "w", encoding="utf-8") as f:
-        f.write(diff)
 
+# Compiled FastRules per distinct set of regex rules
+_fast_rules_cache: Dict[str, FastRules] = {}
+
+
+def _fast_rules(rules_cfg: Dict[str, RuleConfig]) -> FastRules:
+    regex_cfg = {name: cfg for name, cfg in rules_cfg.items() if cfg.tool == "regex"}
+    key = json.dumps(regex_cfg, sort_keys=True, default=_dump_model)
+    if key not in _fast_rules_cache:
+        _fast_rules_cache[key] = FastRules(regex_cfg)
+    return _fast_rules_cache[key]
+
+
+def _diff_only_lint(diff: str, rules_cfg: Dict[str, RuleConfig]) -> dict:
     results = {}
+    style_issues = None
     for name, cfg in rules_cfg.items():
         issues = []
-        if cfg["tool"] == "flake8":
-            proc = subprocess.run(
-                ["flake8", "--diff", "temp.diff"],
-                capture_output=True,
-                text=True,
-            )
-            issues = [l.strip() for l in proc.stdout.splitlines() if l.strip()]
+        if cfg.tool == "flake8":
+            # no files to hand flake8 here (and flake8 >= 6 has no --diff), so
+            # pycodestyle checks the hunks themselves
+            if style_issues is None:
+                style_issues = _style_check_hunks(diff)
+            issues = style_issues
         # radon & bandit are skipped in diff-only mode
-        results[name] = issues[: cfg.get("threshold", 0)] if cfg.get("threshold") else issues
+        results[name] = issues[: cfg.threshold] if cfg.threshold else issues
     return results
 
 
+# pycodestyle's checks that judge a line on its own. The token / logical-line ones
+# (indentation, operators, blank lines, ...) depend on code outside the hunk and
+# misfire on hunks that start mid-statement, e.g. inside a call's arguments
+_HUNK_CODES = ("W191", "W291", "W293", "E501")
+# pycodestyle with flake8's defaults (79 columns), no config files
+_pycodestyle_options = pycodestyle.StyleGuide(quiet=True).options
+
+
+class _HunkReport(pycodestyle.BaseReport):
+    """pycodestyle report that keeps (line, column, text) of _HUNK_CODES in memory."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.hits = []
+
+    def error(self, line_number, offset, text, check):
+        if text.startswith(_HUNK_CODES):
+            self.hits.append((line_number, offset + 1, text))
+
+
+def _style_check_hunks(diff: str) -> List[str]:
+    """
+    flake8's line-level style checks (pycodestyle's W191, W291, W293, E501) for the
+    lines a diff adds, flake8-formatted. Everything else needs the whole file, i.e.
+    PR mode.
+    """
+    try:
+        patch = PatchSet(diff)
+    except UnidiffParseError:
+        return []
+
+    issues = []
+    for pf in patch:
+        if pf.is_removed_file or not pf.path.endswith(".py"):
+            continue
+        added = [l for hunk in pf for l in hunk if l.is_added]
+        text = [l.value if l.value.endswith("\n") else l.value + "\n" for l in added]
+        if not text:
+            continue
+        report = _HunkReport(_pycodestyle_options)
+        checker = pycodestyle.Checker(
+            filename=pf.path, lines=text, options=_pycodestyle_options, report=report
+        )
+        # the state check_all() would set up; what a lone line can't tell gets the default
+        checker.total_lines = len(text)
+        checker.indent_char, checker.multiline, checker.noqa = " ", False, False
+        for i, line in enumerate(text, 1):
+            if pycodestyle.noqa(line):  # flake8 drops every code on a "# noqa" line
+                continue
+            checker.line_number = i
+            checker.check_physical(line)
+        issues += [
+            f"{pf.path}:{added[i - 1].target_line_no}:{col}: {msg}" for i, col, msg in sorted(report.hits)
+        ]
+    return issues
+
+
+class _ViolationCollector(BaseFormatter):
+    """flake8 formatter that keeps violations in memory instead of printing them."""
+
+    def after_init(self):
+        self.violations = []
+
+    def handle(self, error):
+        self.violations.append(error)
+
+    def format(self, error):
+        return None
+
+
+# Where flake8 looks for its settings, in its own lookup order
+_FLAKE8_CONFIGS = ("setup.cfg", "tox.ini", ".flake8")
+# Every config file the linters read from a checkout
+_LINT_CONFIGS = (*_FLAKE8_CONFIGS, ".bandit")
+
+# Style guides per distinct flake8 config: building one loads every flake8 plugin.
+# Kept per thread, as a guide reports into its one collector, so the service's
+# workers each lint with their own instead of queueing for a shared one
+_flake8_local = threading.local()
+
+
+def _flake8_config(root: str) -> Optional[str]:
+    # the first candidate with a flake8 section wins, as in flake8 itself
+    for name in _FLAKE8_CONFIGS:
+        path = os.path.join(root, name)
+        parser = configparser.RawConfigParser()
+        try:
+            parser.read(path, encoding="utf-8")
+        except (UnicodeDecodeError, configparser.Error):
+            continue
+        if "flake8" in parser or "flake8:local-plugins" in parser:
+            return path
+    return None
+
+
+def _style_guide(root: str):
+    """(style guide, its collector) configured from the checkout's own flake8 config."""
+    config = _flake8_config(root)
+    if config is None:
+        # no config in the repo: flake8's defaults, not whatever the service's cwd has
+        key, argv = "", ["--isolated"]
+    else:
+        with open(config, "rb") as fh:
+            key, argv = blake3(fh.read()).hexdigest(), ["--config", config]
+    # in-process and serial: flake8's default --jobs=auto would fork a process pool
+    # per call from a worker thread (overriding any `jobs` in the repo's config)
+    argv.append("--jobs=1")
+    style_guides = getattr(_flake8_local, "style_guides", None)
+    if style_guides is None:
+        style_guides = _flake8_local.style_guides = _LRUCache(maxsize=32)
+    cached = style_guides.get(key)
+    if cached is None:
+        # flake8_legacy.get_style_guide(), minus its config lookup in the cwd
+        application = flake8_app.Application()
+        application.plugins, application.options = flake8_parse_args(argv)
+        application.make_formatter()
+        application.make_guide()
+        application.make_file_checker_manager([])
+        guide = flake8_legacy.StyleGuide(application)
+        guide.init_report(_ViolationCollector)
+        cached = (guide, application.formatter)
+        style_guides.put(key, cached)
+    return cached
+
+
+def _flake8_files(files: List[str], root: str) -> List[str]:
+    # with no paths flake8 would lint the whole cwd
+    if not files:
+        return []
+    guide, collector = _style_guide(root)
+    collector.violations = []
+    guide.check_files([os.path.join(root, f) for f in files])
+    violations = collector.violations
+    return [
+        f"{os.path.relpath(v.filename, root)}:{v.line_number}:{v.column_number}: {v.code} {v.text}"
+        for v in violations
+    ]
+
+
+def _radon_one(f: str, root: str) -> List[str]:
+    # module-level so ProcessPoolExecutor workers can unpickle it
+    try:
+        # tokenize.open honours PEP 263 coding cookies (e.g. latin-1), else UTF-8
+        with tokenize.open(os.path.join(root, f)) as fh:
+            source = fh.read()
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        # missing or undecodable: skipped, as `radon cc` did
+        return []
+    try:
+        blocks = sorted_results(cc_visit(source))
+    except SyntaxError as e:
+        return [f"{f}: ERROR: {e}"]
+    return [
+        f"{f}: {b.letter} {b.lineno}:{b.col_offset} {b.fullname} - {cc_rank(b.complexity)}"
+        for b in blocks
+    ]
+
+
+# Below this many files, worker start-up costs more than the parallel speed-up
+_RADON_PARALLEL_MIN = 16
+# Shared across requests; forkserver since the service process is multi-threaded
+_radon_pool = None
+_radon_pool_lock = threading.Lock()
+
+
+def _get_radon_pool() -> ProcessPoolExecutor:
+    global _radon_pool
+    with _radon_pool_lock:
+        if _radon_pool is None:
+            _radon_pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+    return _radon_pool
+
+
+def _radon_files(files: List[str], root: str) -> List[str]:
+    # cc_visit is pure-Python and CPU-bound, so large PRs fan out to processes (not threads)
+    if len(files) < _RADON_PARALLEL_MIN:
+        per_file = map(_radon_one, files, repeat(root))
+    else:
+        per_file = _get_radon_pool().map(_radon_one, files, repeat(root), chunksize=4)
+    return [line for lines in per_file for line in lines]
+
+
+# Persistent bandit findings keyed by file content, so unchanged files are never rescanned
+_BANDIT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "ai-reviewer", "bandit_cache.db"
+)
+_bandit_cache_lock = threading.Lock()
+
+
+def _csv(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def _bandit_tree(root: str) -> List[str]:
+    # the checkout's .bandit, as `bandit -r .` reads it: tests, skips and exclude
+    ini_path = os.path.join(root, ".bandit")
+    ini = (bandit_utils.parse_ini_file(ini_path) if os.path.isfile(ini_path) else None) or {}
+    profile = {"include": set(_csv(ini.get("tests"))), "exclude": set(_csv(ini.get("skips")))}
+    mgr = BanditManager(BanditConfig(), "file", quiet=True, profile=profile)
+
+    # 1) hash every Python file in the checkout that .bandit doesn't exclude
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in BANDIT_EXCLUDE]
+        paths += [os.path.join(dirpath, fn) for fn in filenames if fn.endswith(".py")]
+    mgr.discover_files(
+        paths,
+        excluded_paths=",".join(os.path.normpath(os.path.join(root, p)) for p in _csv(ini.get("exclude"))),
+    )
+    # findings depend on the selected tests too
+    tests = ",".join(sorted(profile["include"])) + "-" + ",".join(sorted(profile["exclude"]))
+    hashes = {}
+    for path in mgr.files_list:
+        with open(path, "rb") as fh:
+            digest = blake3(fh.read()).hexdigest()
+        hashes[os.path.relpath(path, root)] = f"{bandit.__version__}:{tests}:{digest}"
+
+    # 2) reuse findings for content bandit has already seen
+    os.makedirs(os.path.dirname(_BANDIT_CACHE_PATH), exist_ok=True)
+    with _bandit_cache_lock, shelve.open(_BANDIT_CACHE_PATH) as db:
+        found = {rel: db[key] for rel, key in hashes.items() if key in db}
+
+    # 3) scan only new / changed files, then remember their findings
+    todo = [rel for rel in hashes if rel not in found]
+    if todo:
+        fresh = {rel: [] for rel in todo}
+        mgr.discover_files([os.path.join(root, rel) for rel in todo])
+        mgr.run_tests()
+        for issue in mgr.get_issue_list():
+            fresh[os.path.relpath(issue.fname, root)].append(issue.text)
+        with _bandit_cache_lock, shelve.open(_BANDIT_CACHE_PATH) as db:
+            for rel, texts in fresh.items():
+                db[hashes[rel]] = texts
+        found.update(fresh)
+
+    return [f"{rel}: {text}" for rel in sorted(found) for text in found[rel]]
+
+
+# Extra history fetched, in order, until the PR and its base share a commit (0 = all of it)
+_DEEPEN_STEPS = (50, 500, 0)
+
+
+def fetch_pr(git_dir: str, pr_number: int, base: str, env=None) -> str:
+    """
+    Fetch the PR tip into refs/pr/<n> and the base tip into refs/base/<base> of the
+    shallow repo at git_dir, deepening until the two share a merge-base. Returns the
+    range to diff as commit ids, merge-base..PR, i.e. what `git diff <base>...<PR>`
+    compares; unlike the refs, it can't move under a later fetch.
+    """
+    pr_ref, base_ref = f"refs/pr/{pr_number}", f"refs/base/{base}"
+    # forced, PRs get rebased
+    refspecs = [f"+pull/{pr_number}/head:{pr_ref}", f"+{base}:{base_ref}"]
+
+    def git(*args, check=True):
+        return subprocess.run(
+            ["git", "-C", git_dir, *args], capture_output=True, text=True, env=env, check=check
+        )
+
+    git("fetch", "--depth=1", "--no-tags", "origin", *refspecs)
+    base_id, pr_id = git("rev-parse", base_ref, pr_ref).stdout.split()
+    for step in (*_DEEPEN_STEPS, None):
+        mb = git("merge-base", base_id, pr_id, check=False)
+        if mb.returncode == 0:
+            return f"{mb.stdout.strip()}..{pr_id}"
+        if step is None or git("rev-parse", "--is-shallow-repository").stdout.strip() != "true":
+            break
+        git("fetch", "--unshallow" if step == 0 else f"--deepen={step}", "--no-tags", "origin", *refspecs)
+    # unrelated histories: all that's left is comparing the two tips
+    return f"{base_id}..{pr_id}"
+
+
 def _clone_and_lint(repo_url, pr_number, base, rules_cfg):
     """
-    Shallow-clone the repo, checkout the PR branch, diff against base,
-    then run flake8, radon, and bandit on the changed files.
+    Shallow, blob-less bare clone of the repo, fetch the PR head (see fetch_pr),
+    then lint it like any other prepared repo.
+    """
+    git_dir = tempfile.mkdtemp(prefix="ai-review-")
+    try:
+        subprocess.run(
+            ["git", "clone", "--bare", "--depth=1", "--filter=blob:none", repo_url, git_dir],
+            check=True,
+        )
+        return _lint_pr(git_dir, fetch_pr(git_dir, pr_number, base), rules_cfg)
+    finally:
+        _rmtree(git_dir)
+
+
+def _lint_pr(git_dir: str, rev_range: str, rules_cfg: Dict[str, RuleConfig]) -> dict:
+    """
+    Check only the changed Python files of rev_range out of git_dir into a throwaway
+    worktree (so only their blobs get downloaded), then run flake8, radon, and bandit
+    on them in-process (no interpreter start-up per tool).
     """
-    temp_dir = tempfile.mkdtemp(prefix="ai-review-")
+    work_dir = tempfile.mkdtemp(prefix="ai-review-")
+    pr_id = rev_range.split("..", 1)[1]
     results = {name: [] for name in rules_cfg}
+    # never block a worker on a credential prompt while blobs are fetched
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
 
-    def git(cmd):
-        return subprocess.run(cmd, cwd=temp_dir, capture_output=True, text=True, check=True)
+    def git(*args, cwd=git_dir, **kwargs):
+        return subprocess.run(
+            ["git", "-C", cwd, *args],
+            capture_output=True, text=True, env=env, check=True, **kwargs
+        )
 
     try:
-        # 1) Clone & fetch PR
-        subprocess.run(["git", "clone", "--depth", "1", repo_url, temp_dir], check=True)
-        git(["git", "fetch", "origin", f"pull/{pr_number}/head:pr_branch"])
-        git(["git", "checkout", "pr_branch"])
-
-        # 2) Get changed Python files
-        diff_stdout = git(
-            ["git", "diff", f"origin/{base}...HEAD", "--name-only", "--", "*.py"]
-        ).stdout
+        # 1) Get changed Python files (diff works on refs; no working tree needed),
+        #    minus deleted ones: there is nothing left of them to lint
+        diff_stdout = git("diff", rev_range, "--name-only", "--diff-filter=d", "--", "*.py").stdout
         files = [f for f in diff_stdout.splitlines() if f.endswith(".py")]
 
+        # 2) Materialize only those files, plus the linters' config files so the repo's
+        #    own settings apply, in a worktree sharing git_dir's objects (no clone);
+        #    with nothing changed there is nothing to check out
+        if files:
+            configs = git("ls-tree", "--name-only", pr_id, "--", *_LINT_CONFIGS).stdout.split()
+            git("worktree", "add", "--no-checkout", "--detach", work_dir, pr_id)
+            git("--literal-pathspecs", "checkout", pr_id, "--pathspec-from-file=-",
+                cwd=work_dir, input="\n".join(files + configs))
+
         # 3) For each rule, run the appropriate tool
         for name, cfg in rules_cfg.items():
-            tool = cfg["tool"]
-            thresh = cfg.get("threshold", 0)
+            tool = cfg.tool
+            thresh = cfg.threshold
             issues = []
 
             if tool == "flake8":
-                for f in files:
-                    p = subprocess.run(
-                        ["flake8", f],
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                    )
-                    issues += [l.strip() for l in p.stdout.splitlines() if l.strip()]
+                issues = _flake8_files(files, work_dir)
 
             elif tool == "radon":
-                for f in files:
-                    p = subprocess.run(
-                        ["radon", "cc", "--min", "A", f],
-                        cwd=temp_dir,
-                        capture_output=True,
-                        text=True,
-                    )
-                    issues += [l.strip() for l in p.stdout.splitlines() if l.strip()]
+                issues = _radon_files(files, work_dir)
 
             elif tool == "bandit":
-                # scan entire PR tree for security
-                p = subprocess.run(
-                    ["bandit", "-r", ".", "-f", "json", "-q"],
-                    cwd=temp_dir,
-                    capture_output=True,
-                    text=True,
-                )
-                try:
-                    data = json.loads(p.stdout)
-                    for item in data.get("results", []):
-                        fname = item.get("filename")
-                        txt = item.get("issue_text")
-                        issues.append(f"{fname}: {txt}")
-                except json.JSONDecodeError:
-                    pass
+                # scan the checked-out (changed) files for security
+                issues = _bandit_tree(work_dir)
 
             # Apply threshold
             if thresh and len(issues) > thresh:
@@ -125,31 +611,96 @@ def _clone_and_lint(repo_url, pr_number, base, rules_cfg):
         return results
 
     finally:
-        # Clean up even if Windows marks files read-only
-        def on_rm_error(func, path, _):
-            os.chmod(path, stat.S_IWRITE)
-            func(path)
+        subprocess.run(
+            ["git", "-C", git_dir, "worktree", "remove", "--force", work_dir],
+            capture_output=True, env=env
+        )
+        _rmtree(work_dir)
+
+
+def _rmtree(path: str) -> None:
+    # Clean up even if Windows marks files read-only
+    def on_rm_error(func, path, _):
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path, onerror=on_rm_error)
+
 
-        shutil.rmtree(temp_dir, onerror=on_rm_error)
+# Unchanged lines kept around each +/- line
+_CONTEXT_LINES = 1
+
+
+def _condense_diff(diff: str, ai_cfg: AiReviewConfig) -> str:
+    """
+    Shrink the diff before it goes into the prompt: drop binary files and files
+    matching skip_globs, keep only +/- lines with a line of context, and cap
+    each hunk at max_hunk_lines.
+    """
+    try:
+        patch = PatchSet(diff)
+    except UnidiffParseError:
+        return diff
+    if not patch:
+        # not a unified diff, send it as-is
+        return diff
 
+    skip_globs = ai_cfg.skip_globs
+    max_lines = ai_cfg.max_hunk_lines
+    out = []
+    for pf in patch:
+        base_name = os.path.basename(pf.path)
+        if pf.is_binary_file or any(
+            fnmatch(pf.path, g) or fnmatch(base_name, g) for g in skip_globs
+        ):
+            continue
 
-def run_ai_review(diff: str, ai_cfg: dict):
-    prompt = (
+        out.append(f"--- {pf.source_file}\n+++ {pf.target_file}\n")
+        for hunk in pf:
+            lines = list(hunk)
+            changed = [i for i, l in enumerate(lines) if l.is_added or l.is_removed]
+            keep = {
+                j
+                for i in changed
+                for j in range(i - _CONTEXT_LINES, i + _CONTEXT_LINES + 1)
+            }
+            kept = [str(l) if str(l).endswith("\n") else f"{l}\n"
+                    for i, l in enumerate(lines) if i in keep]
+
+            out.append(
+                f"@@ -{hunk.source_start},{hunk.source_length} "
+                f"+{hunk.target_start},{hunk.target_length} @@ {hunk.section_header}".rstrip()
+                + "\n"
+            )
+            out += kept[:max_lines]
+            if len(kept) > max_lines:
+                out.append(f"... ({len(kept) - max_lines} more lines)\n")
+    return "".join(out)
+
+
+def _build_prompt(diff: str) -> str:
+    return (
         "You are a senior code reviewer. Give concise suggestions, "
         "then end with a line 'Confidence: X.YZ' where X.YZ ∈ [0,1].\n\n"
         f"{diff}"
     )
-    resp = openai.chat.completions.create(
-        model=ai_cfg.get("model", "gpt-4o-mini"),
-        messages=[{"role": "user", "content": prompt}],
-        temperature=ai_cfg.get("temperature", 0.2),
-    )
+
+
+def _parse_review(resp):
     choice = resp.choices[0]
     message = getattr(choice, "message", None)
     if not message or not message.content:
         raise RuntimeError("No content returned from OpenAI API")
+    return parse_review_text(message.content)
+
+
+def parse_review_text(content: str):
+    """Split a review into its comment lines and the trailing 'Confidence: X.YZ' score."""
+    if not content.strip():
+        raise RuntimeError("No content returned from OpenAI API")
 
-    lines = message.content.strip().splitlines()
+    lines = content.strip().splitlines()
     *comments, conf = lines
     try:
         score = float(conf.split(":", 1)[1].strip())
@@ -159,10 +710,172 @@ def run_ai_review(diff: str, ai_cfg: dict):
     return comments, score
 
 
+def run_ai_review(diff: str, ai_cfg: AiReviewConfig):
+    ai_cfg = AiReviewConfig.model_validate(ai_cfg)
+    diff = _condense_diff(diff, ai_cfg)
+    if not diff.strip():
+        # only skipped / binary files (e.g. a lockfile-only PR): nothing to ask the model
+        return [], 1.0
+    key = _cache_key(diff, ai_cfg)
+    cached = _ai_cache.get(key)
+    if cached is None:
+        resp = openai.chat.completions.create(
+            model=ai_cfg.model,
+            messages=[{"role": "user", "content": _build_prompt(diff)}],
+            temperature=ai_cfg.temperature,
+        )
+        cached = _parse_review(resp)
+        _ai_cache.put(key, cached)
+    comments, score = cached
+    return list(comments), score
+
+
+_async_client: Optional[openai.AsyncOpenAI] = None
+
+
+def _get_async_client() -> openai.AsyncOpenAI:
+    # Created lazily so importing this module never requires an API key
+    global _async_client
+    if _async_client is None:
+        _async_client = openai.AsyncOpenAI(api_key=openai.api_key)
+    return _async_client
+
+
+class RateLimitedAIClient:
+    """
+    Token bucket in front of the async OpenAI client. Up to `rpm` calls may
+    burst at once; after that the bucket refills continuously at rpm/60 per
+    second and callers queue in arrival order instead of hitting HTTP 429.
+    """
+
+    def __init__(self, rpm: Optional[int] = None):
+        self.rpm = rpm
+        self._tokens = float(rpm or 0)
+        self._updated: Optional[float] = None
+        # Created on first use: asyncio primitives need the running loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if not self.rpm:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        # Holding the lock while sleeping is what makes this a FIFO queue
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.rpm, self._tokens + (now - self._updated) * self.rpm / 60)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * 60 / self.rpm)
+
+    async def submit(self, **kwargs):
+        await self.acquire()
+        return await _get_async_client().chat.completions.create(**kwargs)
+
+
+_ai_clients: Dict[Optional[int], RateLimitedAIClient] = {}
+
+
+def _ai_client(ai_cfg: AiReviewConfig) -> RateLimitedAIClient:
+    # One bucket per rpm setting, shared by every request in the process
+    if ai_cfg.rpm not in _ai_clients:
+        _ai_clients[ai_cfg.rpm] = RateLimitedAIClient(ai_cfg.rpm)
+    return _ai_clients[ai_cfg.rpm]
+
+
+async def run_ai_review_async(diff: str, ai_cfg: AiReviewConfig):
+    """
+    Same as run_ai_review, but awaits the OpenAI call so the service's
+    event loop stays free while the model is generating.
+    """
+    ai_cfg = AiReviewConfig.model_validate(ai_cfg)
+    diff = _condense_diff(diff, ai_cfg)
+    if not diff.strip():
+        return [], 1.0  # see run_ai_review
+    key = _cache_key(diff, ai_cfg)
+    cached = _ai_cache.get(key)
+    if cached is None:
+        resp = await _ai_client(ai_cfg).submit(
+            model=ai_cfg.model,
+            messages=[{"role": "user", "content": _build_prompt(diff)}],
+            temperature=ai_cfg.temperature,
+        )
+        cached = _parse_review(resp)
+        _ai_cache.put(key, cached)
+    comments, score = cached
+    return list(comments), score
+
+
+async def stream_ai_review(diff: str, ai_cfg: AiReviewConfig):
+    """
+    Yield the review text as the model generates it. The caller owns the
+    buffered text; pass it to parse_review_text once the stream ends.
+    """
+    ai_cfg = AiReviewConfig.model_validate(ai_cfg)
+    diff = _condense_diff(diff, ai_cfg)
+    if not diff.strip():
+        # see run_ai_review; what parse_review_text reads as ([], 1.0)
+        yield "Confidence: 1.0"
+        return
+    key = _cache_key(diff, ai_cfg)
+    cached = _ai_cache.get(key)
+    if cached is not None:
+        comments, score = cached
+        # the exact score, so a replay parses back to what /review returns
+        yield "\n".join([*comments, f"Confidence: {score}"])
+        return
+
+    stream = await _ai_client(ai_cfg).submit(
+        model=ai_cfg.model,
+        messages=[{"role": "user", "content": _build_prompt(diff)}],
+        temperature=ai_cfg.temperature,
+        stream=True,
+    )
+    buffer = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            buffer.append(delta)
+            yield delta
+    _ai_cache.put(key, parse_review_text("".join(buffer)))
+
+
+# One keep-alive session for the GitHub API, so comments don't each pay a TCP+TLS handshake
+_gh_session = requests.Session()
+_gh_session.headers.update({"Accept": "application/vnd.github+json"})
+_gh_session.mount(
+    "https://",
+    HTTPAdapter(
+        # Only retry when the connection was never made: once GitHub has the POST,
+        # a read error or 502 may still mean the comment exists, and a retry would
+        # post it twice
+        max_retries=Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.5,
+        )
+    ),
+)
+
+
 def post_pr_comment(body: str):
     token = os.getenv("GITHUB_TOKEN")
     pr = os.getenv("GITHUB_PR_NUMBER")
     repo = os.getenv("GITHUB_REPOSITORY")
     if token and pr and repo:
         url = f"https://api.github.com/repos/{repo}/issues/{pr}/comments"
-        requests.post(url, json={"body": body}, headers={"Authorization": f"token {token}"})
+        resp = _gh_session.post(
+            url,
+            json={"body": body},
+            headers={"Authorization": f"token {token}"},
+            timeout=10,
+        )
+        resp.raise_for_status()
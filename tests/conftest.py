@@ -0,0 +1,110 @@
+# tests/conftest.py
+
+import socket
+import subprocess
+import time
+import types
+
+import pytest
+
+
+def git(cwd, *args) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", "-C", str(cwd), *args],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+def commit(work, files, message) -> str:
+    """Write (or, for None, delete) files in work and commit them; returns the commit id."""
+    for name, text in files.items():
+        if text is None:
+            git(work, "rm", "-q", name)
+        else:
+            (work / name).write_text(text)
+            git(work, "add", name)
+    git(work, "commit", "-q", "-m", message)
+    return git(work, "rev-parse", "HEAD")
+
+
+@pytest.fixture(scope="session")
+def origin(tmp_path_factory):
+    """
+    A GitHub-like origin served over file://, so shallow fetches behave as they would
+    over the network. main moves on after the fork; refs/pull/<n>/head are the PRs:
+      1: edits a.py, deletes dead.py, adds new.py
+      2: PR 1 plus a .flake8 (max-line-length = 20) and a .bandit skipping B605
+      3: renames dead.py to alive.py
+    """
+    work = tmp_path_factory.mktemp("work")
+    git(work, "init", "-q", "-b", "main")
+    fork = commit(work, {
+        "a.py": "import os\n\n\ndef run(cmd):\n    return cmd\n",
+        "dead.py": "x = 1\n",
+        "README": "fixture\n",
+    }, "c0")
+    for i in range(3):
+        commit(work, {"main.txt": f"{i}\n"}, f"main {i}")
+
+    git(work, "checkout", "-q", "-b", "feat", fork)
+    pr1 = commit(work, {
+        "a.py": "import os\n\n\ndef run(cmd):\n    os.system(cmd)  # a long enough line\n",
+        "dead.py": None,
+        "new.py": "y=2\n",
+    }, "feat")
+    pr2 = commit(work, {
+        ".flake8": "[flake8]\nmax-line-length = 20\n",
+        ".bandit": "[bandit]\nskips: B605\n",
+    }, "feat configs")
+
+    git(work, "checkout", "-q", "-b", "rename", fork)
+    git(work, "mv", "dead.py", "alive.py")
+    git(work, "commit", "-q", "-m", "rename")
+    pr3 = git(work, "rev-parse", "HEAD")
+
+    path = tmp_path_factory.mktemp("origin") / "origin.git"
+    git(work, "clone", "-q", "--bare", str(work), str(path))
+    git(path, "update-ref", "refs/pull/1/head", pr1)
+    git(path, "update-ref", "refs/pull/2/head", pr2)
+    git(path, "update-ref", "refs/pull/3/head", pr3)
+    # partial clones need the server's consent, as on GitHub
+    git(path, "config", "uploadpack.allowFilter", "true")
+    git(path, "config", "uploadpack.allowAnySHA1InWant", "true")
+    return types.SimpleNamespace(url=path.as_uri(), fork=fork, pr1=pr1, pr2=pr2, pr3=pr3)
+
+
+@pytest.fixture
+def bare_clone(origin, tmp_path):
+    """A fresh shallow, blob-less bare clone of origin, as the service keeps warm."""
+    path = tmp_path / "clone.git"
+    git(tmp_path, "clone", "-q", "--bare", "--depth=1", "--filter=blob:none", origin.url, str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def origin_daemon(origin):
+    """origin over git:// (a local git daemon): libgit2 can't shallow-fetch over file://."""
+    path = origin.url.removeprefix("file://")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    try:
+        daemon = subprocess.Popen(
+            ["git", "daemon", "--export-all", "--reuseaddr", "--listen=127.0.0.1", f"--port={port}",
+             f"--base-path={path.rsplit('/', 1)[0]}", path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        pytest.skip("git daemon is not available")
+    url = f"git://127.0.0.1:{port}/origin.git"
+    try:
+        for _ in range(50):
+            if subprocess.run(["git", "ls-remote", url], capture_output=True).returncode == 0:
+                break
+            if daemon.poll() is not None:
+                pytest.skip("git daemon is not available")
+            time.sleep(0.1)
+        yield types.SimpleNamespace(**{**vars(origin), "url": url})
+    finally:
+        daemon.terminate()
+        daemon.wait()
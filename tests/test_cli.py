@@ -0,0 +1,63 @@
+# tests/test_cli.py
+
+import subprocess
+
+import pygit2
+import pytest
+from pygit2.enums import CredentialType
+
+from reviewer import cli
+
+
+def test_fetch_pr_diffs_from_merge_base(origin_daemon, tmp_path):
+    diff, rev_range = cli._fetch_pr(str(tmp_path / "repo.git"), origin_daemon.url, 1, "main")
+    assert rev_range == f"{origin_daemon.fork}..{origin_daemon.pr1}"
+    assert [l for l in diff.splitlines() if l.startswith("diff --git")] == [
+        "diff --git a/a.py b/a.py",
+        "diff --git a/dead.py b/dead.py",
+        "diff --git a/new.py b/new.py",
+    ]
+    assert "main.txt" not in diff
+
+
+def test_rule_checks_lint_the_fetched_repo(origin_daemon, tmp_path):
+    git_dir = str(tmp_path / "repo.git")
+    diff, rev_range = cli._fetch_pr(git_dir, origin_daemon.url, 1, "main")
+    rules = {"naming": {"tool": "flake8"}, "complexity": {"tool": "radon"}}
+    assert cli.run_rule_checks(diff, rules, origin_daemon.url, 1, "main", git_dir, rev_range) == {
+        "naming": ["new.py:1:2: E225 missing whitespace around operator"],
+        "complexity": ["a.py: F 4:0 run - A"],
+    }
+
+
+def test_fetch_pr_detects_renames(origin_daemon, tmp_path):
+    diff, _ = cli._fetch_pr(str(tmp_path / "repo.git"), origin_daemon.url, 3, "main")
+    assert "rename from dead.py\nrename to alive.py\n" in diff
+
+
+@pytest.fixture
+def no_credential_helper(monkeypatch):
+    monkeypatch.setattr(cli.subprocess, "run", lambda *a, **kw: subprocess.CompletedProcess(a, 1, "", ""))
+
+
+@pytest.mark.parametrize("server_url, url", [
+    (None, "https://github.com/o/r.git"),
+    ("https://ghe.example.com", "https://ghe.example.com/o/r.git"),
+])
+def test_token_goes_to_github(monkeypatch, no_credential_helper, server_url, url):
+    monkeypatch.setenv("GITHUB_TOKEN", "t0ken")
+    if server_url:
+        monkeypatch.setenv("GITHUB_SERVER_URL", server_url)
+    else:
+        monkeypatch.delenv("GITHUB_SERVER_URL", raising=False)
+    creds = cli._GitCredentials().credentials(url, None, CredentialType.USERPASS_PLAINTEXT)
+    assert creds.credential_tuple == ("x-access-token", "t0ken")
+
+
+def test_token_is_not_sent_to_other_hosts(monkeypatch, no_credential_helper):
+    monkeypatch.setenv("GITHUB_TOKEN", "t0ken")
+    monkeypatch.delenv("GITHUB_SERVER_URL", raising=False)
+    with pytest.raises(pygit2.Passthrough):
+        cli._GitCredentials().credentials(
+            "https://github.com.evil.example/o/r.git", None, CredentialType.USERPASS_PLAINTEXT
+        )
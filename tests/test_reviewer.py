@@ -1,9 +1,407 @@
 # tests/test_reviewer.py
 
-from src.reviewer.reviewer import run_ai_review
+import asyncio
+import os
+import subprocess
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pydantic import ValidationError
+
+import src.reviewer.reviewer as rv
+from src.reviewer.config import AiReviewConfig, Config, RuleConfig, load_config
+from src.reviewer.reviewer import (
+    FastRules,
+    RateLimitedAIClient,
+    _LRUCache,
+    _added_lines,
+    _bandit_tree,
+    _cache_key,
+    _condense_diff,
+    _flake8_files,
+    _lint_pr,
+    _radon_one,
+    _style_check_hunks,
+    _style_guide,
+    fetch_pr,
+    run_ai_review,
+    run_ai_review_async,
+    run_rule_checks,
+)
+
 
 def test_ai_confidence_parsing():
     diff = "--- a/foo.py\n+++ b/foo.py\n@@ -1 +1 @@\n-print('hi')\n+print('hello')\n"
     comments, score = run_ai_review(diff, {"temperature": 0})
     assert isinstance(comments, list)
     assert 0.0 <= score <= 1.0
+
+
+# An added line whose text starts with "++ " looks like a "+++ " file header
+TWO_FILE_DIFF = (
+    "--- a/a.py\n+++ b/a.py\n@@ -1,2 +1,3 @@\n"
+    " ctx\n"
+    "-old\n"
+    "+++ TODO counter\n"
+    "+x = 1  # FIXME\n"
+    "--- a/b.py\n+++ b/b.py\n@@ -10 +10,2 @@\n"
+    " keep\n"
+    "+y = 2  # todo\n"
+    "\\ No newline at end of file\n"
+)
+
+
+def test_added_lines():
+    assert _added_lines(TWO_FILE_DIFF) == [
+        ("a.py", 2, "++ TODO counter"),
+        ("a.py", 3, "x = 1  # FIXME"),
+        ("b.py", 11, "y = 2  # todo"),
+    ]
+
+
+def _regex_rules(**patterns):
+    return {name: RuleConfig(tool="regex", pattern=p) for name, p in patterns.items()}
+
+
+@pytest.fixture(params=["hyperscan", "re"])
+def engine(request, monkeypatch):
+    """Runs a test once per FastRules engine."""
+    if request.param == "re":
+        monkeypatch.setattr(rv, "hyperscan", None)
+    elif rv.hyperscan is None:
+        pytest.skip("hyperscan is not installed")
+    return request.param
+
+
+def test_fast_rules_scan(engine):
+    rules = FastRules({
+        "markers": RuleConfig(tool="regex", pattern=r"\b(TODO|FIXME)\b"),
+        # inline flags are fine: each pattern is compiled on its own
+        "ci_todo": RuleConfig(tool="regex", pattern=r"(?i)todo"),
+        "naming": RuleConfig(tool="flake8"),
+    })
+    assert rules.scan(TWO_FILE_DIFF) == {
+        "markers": ["a.py:2: ++ TODO counter", "a.py:3: x = 1  # FIXME"],
+        "ci_todo": ["a.py:2: ++ TODO counter", "b.py:11: y = 2  # todo"],
+    }
+
+
+def test_fast_rules_falls_back_to_re():
+    # Hyperscan rejects lookarounds and backreferences
+    rules = FastRules(_regex_rules(
+        doubled=r"\b(\w+) \1\b",
+        after_eq=r"(?<== )\d",
+        plain=r"counter",
+    ))
+    if rv.hyperscan is not None:
+        assert rules.re_rules == [0, 1]
+    diff = "--- a/c.py\n+++ b/c.py\n@@ -0,0 +1,2 @@\n+the the counter\n+z = 3\n"
+    assert rules.scan(diff) == {
+        "doubled": ["c.py:1: the the counter"],
+        "after_eq": ["c.py:2: z = 3"],
+        "plain": ["c.py:1: the the counter"],
+    }
+
+
+def test_fast_rules_match_within_a_line(engine):
+    rules = FastRules(_regex_rules(todo_fixme=r"TODO\s+fixme", eol=r"TODO$"))
+    diff = "--- a/a.py\n+++ b/a.py\n@@ -0,0 +1,2 @@\n+x = 1  # TODO\n+fixme()\n"
+    assert rules.scan(diff) == {"todo_fixme": [], "eol": ["a.py:1: x = 1  # TODO"]}
+
+
+def test_run_rule_checks_regex_threshold():
+    rules = {"todo": {"tool": "regex", "pattern": r"\b(TODO|FIXME)\b", "threshold": 1}}
+    assert run_rule_checks(TWO_FILE_DIFF, rules) == {"todo": ["a.py:2: ++ TODO counter"]}
+
+
+def test_regex_rule_validation():
+    with pytest.raises(ValidationError):
+        RuleConfig(tool="regex")
+    with pytest.raises(ValidationError):
+        RuleConfig(tool="regex", pattern="(")
+
+
+def _changed_files(git_dir, rev_range):
+    return subprocess.check_output(
+        ["git", "-C", git_dir, "diff", "--name-only", rev_range], text=True
+    ).split()
+
+
+def test_fetch_pr_diffs_from_merge_base(origin, bare_clone):
+    rev_range = fetch_pr(bare_clone, 1, "main")
+    assert rev_range == f"{origin.fork}..{origin.pr1}"
+    # main's later commits (main.txt) are not part of the PR
+    assert _changed_files(bare_clone, rev_range) == ["a.py", "dead.py", "new.py"]
+
+
+def test_fetch_pr_deepens_until_merge_base(origin, bare_clone, monkeypatch):
+    # one step too short to reach the fork point from main, then the whole history
+    monkeypatch.setattr(rv, "_DEEPEN_STEPS", (1, 0))
+    assert fetch_pr(bare_clone, 1, "main") == f"{origin.fork}..{origin.pr1}"
+    assert subprocess.check_output(
+        ["git", "-C", bare_clone, "rev-parse", "--is-shallow-repository"], text=True
+    ).strip() == "false"
+
+
+LINT_RULES = {
+    "naming": RuleConfig(tool="flake8"),
+    "complexity": RuleConfig(tool="radon"),
+    "security": RuleConfig(tool="bandit"),
+}
+
+
+@pytest.fixture
+def checkouts(monkeypatch, tmp_path):
+    """Records which files each lint run had checked out; bandit's cache goes to tmp_path."""
+    monkeypatch.setattr(rv, "_BANDIT_CACHE_PATH", str(tmp_path / "bandit_cache.db"))
+    seen = []
+    bandit_tree = rv._bandit_tree
+
+    def spy(root):
+        seen.append(sorted(
+            os.path.relpath(os.path.join(d, f), root)
+            for d, _, names in os.walk(root) for f in names if f != ".git"
+        ))
+        return bandit_tree(root)
+
+    monkeypatch.setattr(rv, "_bandit_tree", spy)
+    return seen
+
+
+def test_lint_pr_checks_out_only_changed_files(bare_clone, checkouts):
+    results = _lint_pr(bare_clone, fetch_pr(bare_clone, 1, "main"), LINT_RULES)
+    assert checkouts == [["a.py", "new.py"]]
+    assert results["naming"] == ["new.py:1:2: E225 missing whitespace around operator"]
+    assert results["complexity"] == ["a.py: F 4:0 run - A"]
+    assert results["security"] == [
+        "a.py: Starting a process with a shell, possible injection detected, security issue."
+    ]
+    # the throwaway worktree is gone again
+    assert len(subprocess.check_output(
+        ["git", "-C", bare_clone, "worktree", "list"], text=True
+    ).splitlines()) == 1
+
+
+def test_lint_pr_uses_the_repos_configs(bare_clone, checkouts):
+    # PR 2 adds a .flake8 (max-line-length = 20) and a .bandit skipping B605
+    results = _lint_pr(bare_clone, fetch_pr(bare_clone, 2, "main"), LINT_RULES)
+    assert checkouts == [[".bandit", ".flake8", "a.py", "new.py"]]  # not the deleted dead.py
+    assert results["naming"] == [
+        "a.py:5:21: E501 line too long (40 > 20 characters)",
+        "new.py:1:2: E225 missing whitespace around operator",
+    ]
+    assert results["security"] == []
+
+
+def test_flake8_files_reads_repo_config(tmp_path):
+    (tmp_path / "m.py").write_text("value = 'a fairly long line'\n")
+    assert _flake8_files(["m.py"], str(tmp_path)) == []
+    (tmp_path / "tox.ini").write_text("[flake8]\nmax-line-length = 20\n")
+    assert _flake8_files(["m.py"], str(tmp_path)) == [
+        "m.py:1:21: E501 line too long (28 > 20 characters)"
+    ]
+
+
+def test_style_guides_are_serial_and_per_thread(tmp_path):
+    guide, _ = _style_guide(str(tmp_path))
+    assert guide.options.jobs.n_jobs == 1
+    assert _style_guide(str(tmp_path))[0] is guide
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(_style_guide, str(tmp_path)).result()[0] is not guide
+
+
+def test_radon_skips_missing_and_reads_latin1(tmp_path):
+    assert _radon_one("gone.py", str(tmp_path)) == []
+    (tmp_path / "l1.py").write_bytes("# -*- coding: latin-1 -*-\ndef f():\n    return 'é'\n".encode("latin-1"))
+    assert _radon_one("l1.py", str(tmp_path)) == ["l1.py: F 2:0 f - A"]
+
+
+def test_lru_cache():
+    cache = _LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_cache_key():
+    cfg = AiReviewConfig()
+    assert _cache_key("diff", cfg) == _cache_key("diff", AiReviewConfig())
+    assert _cache_key("diff", cfg) != _cache_key("diff2", cfg)
+    assert _cache_key("diff", cfg) != _cache_key("diff", AiReviewConfig(temperature=0))
+    assert _cache_key("diff", {"r": RuleConfig(tool="flake8")}) != _cache_key(
+        "diff", {"r": RuleConfig(tool="flake8", threshold=1)}
+    )
+
+
+def test_style_check_hunks_ignores_code_outside_the_hunk():
+    # the hunk starts inside a call's keyword arguments: fine for flake8 on the whole file
+    diff = (
+        "--- a/m.py\n+++ b/m.py\n@@ -21,3 +21,4 @@ def review(req):\n"
+        "             cfg.rules,\n"
+        "             repo_url=req.repo_url,\n"
+        "+            git_dir=git_dir,\n"
+        "         )\n"
+    )
+    assert _style_check_hunks(diff) == []
+
+
+def test_style_check_hunks_line_checks():
+    long_line = "x = '" + "a" * 80 + "'"
+    diff = (
+        "--- a/m.py\n+++ b/m.py\n@@ -1 +1,5 @@\n"
+        " def f():\n"
+        "+    y = 1  \n"
+        f"+\t{long_line}\n"
+        f"+    {long_line}  # noqa\n"
+        "+    return y\n"
+    )
+    assert _style_check_hunks(diff) == [
+        "m.py:2:10: W291 trailing whitespace",
+        "m.py:3:1: W191 indentation contains tabs",
+        "m.py:3:80: E501 line too long (87 > 79 characters)",
+    ]
+
+
+def test_condense_diff():
+    diff = (
+        "--- a/uv.lock\n+++ b/uv.lock\n@@ -1 +1 @@\n-a\n+b\n"
+        "--- a/m.py\n+++ b/m.py\n@@ -1,9 +1,9 @@\n"
+        " l1\n l2\n l3\n-old4\n+new4\n l5\n l6\n l7\n l8\n-old9\n+new9\n"
+    )
+    out = _condense_diff(diff, AiReviewConfig())
+    assert "uv.lock" not in out
+    assert out == (
+        "--- a/m.py\n+++ b/m.py\n@@ -1,9 +1,9 @@\n"
+        " l3\n-old4\n+new4\n l5\n l8\n-old9\n+new9\n"
+    )
+    capped = _condense_diff(diff, AiReviewConfig(max_hunk_lines=3))
+    assert capped.endswith(" l3\n-old4\n+new4\n... (4 more lines)\n")
+    assert _condense_diff("not a diff", AiReviewConfig()) == "not a diff"
+
+
+def test_nothing_left_to_review_skips_openai(monkeypatch):
+    def no_openai(*_args, **_kwargs):
+        raise AssertionError("OpenAI called")
+
+    monkeypatch.setattr(rv, "openai", types.SimpleNamespace(chat=no_openai))
+    monkeypatch.setattr(rv, "_get_async_client", no_openai)
+    lock_only = "--- a/uv.lock\n+++ b/uv.lock\n@@ -1 +1 @@\n-a\n+b\n"
+    assert run_ai_review(lock_only, AiReviewConfig()) == ([], 1.0)
+    assert asyncio.run(run_ai_review_async(lock_only, AiReviewConfig())) == ([], 1.0)
+
+
+@pytest.fixture
+def bandit_scans(monkeypatch, tmp_path):
+    """Files each bandit run actually scanned, relative to the checkout; cache in tmp_path."""
+    monkeypatch.setattr(rv, "_BANDIT_CACHE_PATH", str(tmp_path / "bandit_cache.db"))
+    scans = []
+    run_tests = rv.BanditManager.run_tests
+
+    def spy(mgr, *args, **kwargs):
+        scans.append(sorted(os.path.basename(f) for f in mgr.files_list))
+        return run_tests(mgr, *args, **kwargs)
+
+    monkeypatch.setattr(rv.BanditManager, "run_tests", spy)
+    return scans
+
+
+def test_bandit_tree_caches_per_file_content(tmp_path, bandit_scans):
+    root = tmp_path / "checkout"
+    (root / "vendor").mkdir(parents=True)
+    (root / "a.py").write_text("import os\nos.system(cmd)\n")
+    (root / "b.py").write_text("x = 1\n")
+    (root / "vendor" / "v.py").write_text("import os\nos.system(cmd)\n")
+    shell = "Starting a process with a shell, possible injection detected, security issue."
+
+    first = _bandit_tree(str(root))
+    assert first == [f"a.py: {shell}", f"{os.path.join('vendor', 'v.py')}: {shell}"]
+    assert _bandit_tree(str(root)) == first
+    (root / "b.py").write_text("y = 2\n")
+    assert _bandit_tree(str(root)) == first
+    assert bandit_scans == [["a.py", "b.py", "v.py"], ["b.py"]]  # unchanged files come from the cache
+
+    # the repo's .bandit: other tests selected means other findings, so no cache hits
+    (root / ".bandit").write_text("[bandit]\nskips: B605\nexclude: vendor\n")
+    assert _bandit_tree(str(root)) == []
+    assert bandit_scans[-1] == ["a.py", "b.py"]
+    (root / ".bandit").unlink()
+    assert _bandit_tree(str(root)) == first
+    assert len(bandit_scans) == 3
+
+
+def test_config_validation():
+    with pytest.raises(ValidationError):
+        RuleConfig(tool="pylint")
+    with pytest.raises(ValidationError):
+        RuleConfig(tool="flake8", threshold=-1)
+    with pytest.raises(ValidationError):
+        AiReviewConfig(min_confidence=1.5)
+    with pytest.raises(ValidationError):
+        Config.model_validate({"workers": 0, "rules": {}})
+
+
+def test_load_config(tmp_path):
+    assert load_config().rules  # the shipped config.yaml
+    path = tmp_path / "config.yaml"
+    path.write_text("rules:\n  bad:\n    tool: regex\n")
+    with pytest.raises(ValidationError):
+        load_config(str(path))
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """A loop clock that only moves when the code under test sleeps; records the sleeps."""
+    clock = types.SimpleNamespace(now=0.0, sleeps=[])
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        clock.sleeps.append(delay)
+        clock.now += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(rv.asyncio, "sleep", sleep)
+    return clock
+
+
+def test_rate_limiter_bursts_then_throttles(fake_clock):
+    async def main():
+        asyncio.get_running_loop().time = lambda: fake_clock.now
+        limiter = RateLimitedAIClient(rpm=120)  # refills one token every 0.5s
+        for _ in range(120):
+            await limiter.acquire()
+        assert fake_clock.sleeps == []
+
+        done = []
+
+        async def call(i):
+            await limiter.acquire()
+            done.append((i, fake_clock.now))
+
+        await asyncio.gather(*(call(i) for i in range(3)))
+        return done
+
+    assert asyncio.run(main()) == [(0, 0.5), (1, 1.0), (2, 1.5)]  # in arrival order
+    assert fake_clock.sleeps == [0.5, 0.5, 0.5]
+
+
+def test_rate_limiter_unlimited(monkeypatch, fake_clock):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return "resp"
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(
+        completions=types.SimpleNamespace(create=create)))
+    monkeypatch.setattr(rv, "_get_async_client", lambda: client)
+
+    async def main():
+        limiter = RateLimitedAIClient(rpm=None)
+        return [await limiter.submit(model="m") for _ in range(1000)]
+
+    assert asyncio.run(main()) == ["resp"] * 1000
+    assert len(calls) == 1000 and fake_clock.sleeps == []
@@ -0,0 +1,115 @@
+# tests/test_service.py
+# Runs the endpoints with OpenAI mocked out; run pytest from the repo root (service.py reads ./config.yaml).
+
+import json
+import subprocess
+import types
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import reviewer.reviewer as rv
+import service
+
+DIFF = "--- a/x.py\n+++ b/x.py\n@@ -0,0 +1,2 @@\n+import os\n+x = 1\n"
+REVIEW = ["- use f-strings\n", "- name x better\n", "Confidence: 0.875"]
+
+
+@pytest.fixture
+def ai_calls(monkeypatch):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if kwargs.get("stream"):
+            async def chunks():
+                for text in REVIEW:
+                    delta = types.SimpleNamespace(content=text)
+                    yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+            return chunks()
+        message = types.SimpleNamespace(content="".join(REVIEW))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(
+        completions=types.SimpleNamespace(create=create)))
+    monkeypatch.setattr(rv, "_get_async_client", lambda: client)
+    # fresh caches and rate limiters, so every test really reaches the mock
+    monkeypatch.setattr(rv, "_ai_cache", rv._LRUCache(maxsize=8))
+    monkeypatch.setattr(rv, "_rule_cache", rv._LRUCache(maxsize=8))
+    monkeypatch.setattr(rv, "_ai_clients", {})
+    return calls
+
+
+@pytest.fixture
+def client():
+    with TestClient(service.app) as c:
+        yield c
+
+
+def test_review(client, ai_calls):
+    resp = client.post("/review", json={"diff": DIFF})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["ai_comments"] == ["- use f-strings", "- name x better"]
+    assert body["ai_score"] == 0.875
+    assert body["complexity"] == [] and body["security"] == []  # diff-only mode
+    assert set(body["rules"]) == set(service.cfg.rules)
+    assert len(ai_calls) == 1
+
+
+def test_review_is_cached(client, ai_calls):
+    first = client.post("/review", json={"diff": DIFF}).json()
+    assert client.post("/review", json={"diff": DIFF}).json() == first
+    assert len(ai_calls) == 1
+
+
+def test_review_batch_keeps_other_items_on_error(client, ai_calls, monkeypatch):
+    def fail(*_args):
+        raise subprocess.CalledProcessError(128, ["git", "fetch"])
+
+    monkeypatch.setattr(service, "_fetch_and_diff", fail)
+    resp = client.post("/review_batch", json={"items": [
+        {"diff": DIFF},
+        {"repo_url": "https://example.invalid/repo.git", "pr_number": 1},
+    ]})
+    assert resp.status_code == 200
+    ok, failed = resp.json()
+    assert ok["ai_score"] == 0.875
+    assert failed == {"error": "Git error: Command '['git', 'fetch']' returned non-zero exit status 128."}
+
+
+def _events(client, req):
+    """(event, decoded data) for each Server-Sent Event /review/stream sends."""
+    with client.stream("POST", "/review/stream", json=req) as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = resp.read().decode()
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_lockfile_only_diff_skips_openai(client, ai_calls):
+    lock_only = "--- a/uv.lock\n+++ b/uv.lock\n@@ -1 +1 @@\n-a\n+b\n"
+    body = client.post("/review", json={"diff": lock_only}).json()
+    assert (body["ai_comments"], body["ai_score"]) == ([], 1.0)
+    name, result = _events(client, {"diff": lock_only})[-1]
+    assert name == "result"
+    assert (result["ai_comments"], result["ai_score"]) == ([], 1.0)
+    assert ai_calls == []
+
+
+def test_review_stream(client, ai_calls):
+    events = _events(client, {"diff": DIFF})
+    assert [data for name, data in events if name == "token"] == REVIEW
+    name, result = events[-1]
+    assert name == "result"
+    assert result["ai_comments"] == ["- use f-strings", "- name x better"]
+    assert ai_calls[0]["stream"] is True
+    # a cache hit replays the same review, score included, as /review returns it
+    assert _events(client, {"diff": DIFF})[-1] == ("result", result)
+    assert client.post("/review", json={"diff": DIFF}).json()["ai_score"] == result["ai_score"] == 0.875
+    assert len(ai_calls) == 1